@@ -0,0 +1,149 @@
+# archive.py
+import base64
+import json
+import logging
+import mmap
+import os
+import struct
+from telethon.extensions import BinaryReader
+from telethon.tl.types import MessageMediaWebPage
+
+logger = logging.getLogger(__name__)
+
+# One fixed-size index slot per message ID: (segment number, byte offset, line length).
+# Segment numbers start at 1, so an all-zero slot means the message is not archived.
+INDEX_RECORD = struct.Struct('<IQI')
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+def resolve_archive_path(root, user_id, name):
+    """Map an archive name chosen by a user to a directory under `root/<user_id>/`, or raise ValueError."""
+    user_root = os.path.realpath(os.path.join(root, str(user_id)))
+    if not name or os.path.isabs(name) or '..' in name.replace('\\', '/').split('/'):
+        raise ValueError("Archive name must be a relative name without '..'")
+    path = os.path.realpath(os.path.join(user_root, name))
+    # realpath also resolves symlinks, so a link pointing outside the user's directory is rejected too
+    if path == user_root or os.path.commonpath([user_root, path]) != user_root:
+        raise ValueError("Archive name must stay inside your archive directory")
+    return path
+
+def encode_entities(entities):
+    # Entities are stored in Telegram's own serialization, so every entity type (links, mentions, ...) round trips
+    return [base64.b64encode(bytes(entity)).decode('ascii') for entity in entities or ()]
+
+def decode_entities(encoded):
+    return [BinaryReader(base64.b64decode(entity)).tgread_object() for entity in encoded] or None
+
+class ArchivedMessage:
+    """A message read back from an archive, shaped like the Telethon messages the forwarder expects."""
+    __slots__ = ('id', 'date', 'text', 'message', 'entities', 'grouped_id', 'media', 'media_path', 'filename')
+
+    def __init__(self, record, media_dir):
+        self.id = record['id']
+        self.date = record.get('date')
+        self.text = record.get('text') or ""
+        self.message = self.text
+        self.entities = decode_entities(record.get('entities', ()))
+        self.grouped_id = record.get('grouped_id')
+        self.media = None  # Archived media is re-uploaded from media_path, never forwarded
+        self.media_path = os.path.join(media_dir, record['media']) if record.get('media') else None
+        self.filename = record.get('filename')
+
+class MessageArchive:
+    def __init__(self, path):
+        self.path = path
+        self.media_dir = os.path.join(path, 'media')
+        os.makedirs(self.media_dir, exist_ok=True)
+        self.index_path = os.path.join(path, 'index.bin')
+        if not os.path.exists(self.index_path):
+            open(self.index_path, 'wb').close()
+        self.index_file = open(self.index_path, 'r+b')
+        self.index_map = None
+        self.segment_number = self._last_segment_number() or 1
+        self.segment_file = open(self._segment_path(self.segment_number), 'ab')
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, f'segment-{number:06d}.jsonl')
+
+    def _last_segment_number(self):
+        numbers = [int(name[8:14]) for name in os.listdir(self.path) if name.startswith('segment-') and name.endswith('.jsonl')]
+        return max(numbers, default=0)
+
+    def close(self):
+        if self.index_map:
+            self.index_map.close()
+            self.index_map = None
+        self.index_file.close()
+        self.segment_file.close()
+
+    def _index_slot(self, message_id):
+        size = os.fstat(self.index_file.fileno()).st_size
+        offset = message_id * INDEX_RECORD.size
+        if offset + INDEX_RECORD.size > size:
+            return None
+        if self.index_map is None or len(self.index_map) < size:
+            # The index only grows, so remap lazily when a lookup goes past the mapped size
+            if self.index_map:
+                self.index_map.close()
+            self.index_map = mmap.mmap(self.index_file.fileno(), size, access=mmap.ACCESS_READ)
+        segment, position, length = INDEX_RECORD.unpack_from(self.index_map, offset)
+        return (segment, position, length) if segment else None
+
+    def contains(self, message_id):
+        return self._index_slot(message_id) is not None
+
+    def get(self, message_id):
+        slot = self._index_slot(message_id)
+        if slot is None:
+            return None
+        segment, position, length = slot
+        if segment == self.segment_number:
+            self.segment_file.flush()
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(position)
+            return json.loads(f.read(length))
+
+    def get_messages(self, ids):
+        """Mirror `client.get_messages(ids=...)`: one entry per ID, None where nothing was archived."""
+        messages = []
+        for message_id in ids:
+            record = self.get(message_id)
+            messages.append(ArchivedMessage(record, self.media_dir) if record else None)
+        return messages
+
+    def append(self, record):
+        if self.segment_file.tell() >= SEGMENT_MAX_BYTES:
+            self.segment_file.close()
+            self.segment_number += 1
+            self.segment_file = open(self._segment_path(self.segment_number), 'ab')
+
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+        position = self.segment_file.tell()
+        self.segment_file.write(line)
+        self.segment_file.flush()
+
+        # The index slot is written after the line, so a crash leaves at worst an unindexed line
+        os.pwrite(self.index_file.fileno(), INDEX_RECORD.pack(self.segment_number, position, len(line)), record['id'] * INDEX_RECORD.size)
+
+    async def archive_message(self, client, message):
+        filename = None
+        media = None
+        if message.media and not isinstance(message.media, MessageMediaWebPage):
+            document = getattr(message.media, 'document', None)
+            if document is not None:
+                # Videos, voice notes and stickers list other attributes before the filename, if they have one
+                filename = next((attr.file_name for attr in document.attributes if hasattr(attr, 'file_name')), None)
+            path = await client.download_media(message, file=os.path.join(self.media_dir, str(message.id)))
+            if path:
+                media = os.path.relpath(path, self.media_dir)
+
+        self.append({
+            'id': message.id,
+            'date': message.date.isoformat() if message.date else None,
+            'text': message.message or "",
+            'entities': encode_entities(message.entities),
+            'grouped_id': message.grouped_id,
+            'media': media,
+            'filename': filename,
+        })
+        logger.debug(f"Archived message ID {message.id} to {self.path}")
+        return message
@@ -1,13 +1,23 @@
 # commands.py
 import asyncio
+import io
 import logging
+import os
 from telethon import events
 from telethon.errors import ChannelPrivateError, UserNotParticipantError
 from typing import Any
+from archive import MessageArchive, resolve_archive_path
+from profiler import LoopProfiler, ProfilerBusyError
+import planner
 
 logger = logging.getLogger(__name__)
 
-def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
+# A local archive directory can stand in for the source or destination channel
+ARCHIVE_ALTERNATIVES = {'source': 'source_archive', 'destination': 'archive_path'}
+
+def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any, message_sync: Any, config: Any):
+    loop_profiler = LoopProfiler()
+
     @bot.on(events.NewMessage(pattern='/start'))
     async def start_command(event):
         user_id = event.sender_id
@@ -27,10 +37,15 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
         /set_session_string <session_string> - Set the session string for user client (optional)
         /set_source <channel_id> - Set the source channel
         /set_destination <channel_id> - Set the destination channel
+        /set_archive <name> - Archive messages to a local archive instead of a destination channel
+        /set_source_archive <name> - Replay messages from one of your archives instead of a source channel
         /start_forwarding <start_id>-<end_id> - Start the forwarding process with message ID range
+        /plan <start_id>-<end_id> - Estimate how long forwarding a message ID range would take, without forwarding
         /resume_forwarding - Resume the forwarding process from the last saved state
         /status - Check the status of the forwarding process
         /stop_forwarding - Stop the forwarding process
+        /start_sync - Mirror edits and deletions from the source channel to the destination
+        /stop_sync - Stop mirroring edits and deletions
         """
         await event.reply(help_text)
 
@@ -83,14 +98,14 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
             logger.error(f"Unexpected error in /set_session_string command: {str(e)}", exc_info=True)
             await event.reply("An unexpected error occurred. Please try again later.")
 
-    @bot.on(events.NewMessage(pattern='/set_source'))
+    @bot.on(events.NewMessage(pattern=r'/set_source\b'))
     async def set_source_command(event):
         user_id = event.sender_id
         logger.debug(f"Received /set_source command from user {user_id}")
         try:
             _, source_channel = event.text.split()
             source_channel = int(source_channel)  # Ensure the channel ID is stored as an integer
-            await db.save_user_credentials(user_id, {'source': source_channel})
+            await db.save_user_credentials(user_id, {'source': source_channel, 'source_archive': None})
             logger.info(f"User {user_id} set source channel: {source_channel}")
             await event.reply("Source channel set successfully")
         except ValueError:
@@ -107,7 +122,7 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
         try:
             _, destination_channel = event.text.split()
             destination_channel = int(destination_channel)  # Ensure the channel ID is stored as an integer
-            await db.save_user_credentials(user_id, {'destination': destination_channel})
+            await db.save_user_credentials(user_id, {'destination': destination_channel, 'archive_path': None})
             logger.info(f"User {user_id} set destination channel: {destination_channel}")
             await event.reply("Destination channel set successfully")
         except ValueError:
@@ -117,6 +132,47 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
             logger.error(f"Unexpected error in /set_destination command: {str(e)}", exc_info=True)
             await event.reply("An unexpected error occurred. Please try again later.")        
 
+    @bot.on(events.NewMessage(pattern='/set_archive'))
+    async def set_archive_command(event):
+        user_id = event.sender_id
+        logger.debug(f"Received /set_archive command from user {user_id}")
+        try:
+            _, archive_name = event.text.split(maxsplit=1)
+            archive_name = archive_name.strip()
+            # Create the directory now so an unwritable archive is reported here, not when the job starts
+            os.makedirs(resolve_archive_path(config.ARCHIVE_ROOT, user_id, archive_name), exist_ok=True)
+            await db.save_user_credentials(user_id, {'archive_path': archive_name})
+            logger.info(f"User {user_id} set archive destination: {archive_name}")
+            await event.reply("Archive destination set successfully")
+        except ValueError as e:
+            logger.warning(f"User {user_id} provided invalid format for /set_archive: {str(e)}")
+            await event.reply(f"Invalid archive name. Please use: /set_archive <name>. {str(e)}")
+        except OSError as e:
+            logger.error(f"Cannot create archive for user {user_id}: {str(e)}")
+            await event.reply("The archive directory could not be created.")
+        except Exception as e:
+            logger.error(f"Unexpected error in /set_archive command: {str(e)}", exc_info=True)
+            await event.reply("An unexpected error occurred. Please try again later.")
+
+    @bot.on(events.NewMessage(pattern='/set_source_archive'))
+    async def set_source_archive_command(event):
+        user_id = event.sender_id
+        logger.debug(f"Received /set_source_archive command from user {user_id}")
+        try:
+            _, archive_name = event.text.split(maxsplit=1)
+            archive_name = archive_name.strip()
+            if not os.path.isdir(resolve_archive_path(config.ARCHIVE_ROOT, user_id, archive_name)):
+                raise ValueError(f"You have no archive named {archive_name}")
+            await db.save_user_credentials(user_id, {'source_archive': archive_name})
+            logger.info(f"User {user_id} set archive source: {archive_name}")
+            await event.reply("Archive source set successfully")
+        except ValueError as e:
+            logger.warning(f"User {user_id} provided invalid format for /set_source_archive: {str(e)}")
+            await event.reply(f"Invalid archive name. Please use: /set_source_archive <name>. {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error in /set_source_archive command: {str(e)}", exc_info=True)
+            await event.reply("An unexpected error occurred. Please try again later.")
+
     @bot.on(events.NewMessage(pattern='/status'))
     async def status_command(event):
         user_id = event.sender_id
@@ -165,7 +221,7 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
 
         missing_credentials = []
         for cred in ['api_id', 'api_hash', 'source', 'destination']:
-            if cred not in user_data:
+            if cred not in user_data and not user_data.get(ARCHIVE_ALTERNATIVES.get(cred)):
                 missing_credentials.append(cred.replace('_', ' ').title())
 
         if missing_credentials:
@@ -209,7 +265,7 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
 
         missing_credentials = []
         for cred in ['api_id', 'api_hash', 'source', 'destination']:
-            if cred not in user_data:
+            if cred not in user_data and not user_data.get(ARCHIVE_ALTERNATIVES.get(cred)):
                 missing_credentials.append(cred.replace('_', ' ').title())
 
         if missing_credentials:
@@ -239,6 +295,130 @@ def setup_commands(bot: Any, user_client: Any, forwarder: Any, db: Any):
         progress_message = await event.reply(f"Resumed forwarding process from message ID {start_id} to {end_id}. Use /status to check the progress.")
 
         # Resume the forwarding process in a new asyncio task
-        asyncio.create_task(forwarder.forward_messages(user_id, bot, db, progress_message, start_id=start_id, end_id=end_id))
+        asyncio.create_task(forwarder.forward_messages(user_id, bot, db, progress_message, start_id=start_id, end_id=end_id, resumed=True))
+
+    @bot.on(events.NewMessage(pattern='/start_sync'))
+    async def start_sync_command(event):
+        user_id = event.sender_id
+        user_data = await db.get_user_credentials(user_id)
+        if not user_data or any(cred not in user_data for cred in ['api_id', 'api_hash', 'source', 'destination']):
+            logger.warning(f"User {user_id} attempted to start sync with missing credentials")
+            await event.reply("Please set up your credentials first. Use /help to see the available commands.")
+            return
+
+        try:
+            await message_sync.start_sync(user_id)
+            await event.reply("Edit/delete sync started. Changes in the source channel will be mirrored to the destination.")
+        except ValueError:
+            await event.reply("Error: Invalid source or destination channel.")
+        except Exception as e:
+            logger.error(f"Unexpected error in start_sync_command: {str(e)}", exc_info=True)
+            await event.reply("An unexpected error occurred. Please try again later.")
+
+    @bot.on(events.NewMessage(pattern='/stop_sync'))
+    async def stop_sync_command(event):
+        user_id = event.sender_id
+        try:
+            await message_sync.stop_sync(user_id)
+            await event.reply("Edit/delete sync has been stopped.")
+        except Exception as e:
+            logger.error(f"Unexpected error in stop_sync_command: {str(e)}", exc_info=True)
+            await event.reply("An unexpected error occurred. Please try again later.")
+
+    @bot.on(events.NewMessage(pattern='/plan'))
+    async def plan_command(event):
+        user_id = event.sender_id
+        try:
+            _, range_ids = event.text.split()
+            start_id, end_id = map(int, range_ids.split('-'))
+            if start_id >= end_id:
+                raise ValueError("Start ID must be less than End ID")
+            # Each plan costs one get_messages call per batch on the shared user account
+            if end_id - start_id + 1 > config.MAX_PLAN_RANGE:
+                raise ValueError(f"A plan can cover at most {config.MAX_PLAN_RANGE} message IDs")
+        except ValueError as e:
+            logger.warning(f"User {user_id} provided invalid format for plan: {str(e)}")
+            await event.reply(f"Invalid command format. Use: /plan <start_id>-<end_id>. {str(e)}")
+            return
+
+        user_data = await db.get_user_credentials(user_id)
+        if not user_data:
+            logger.warning(f"User {user_id} attempted to plan without any credentials")
+            await event.reply("Please set up your credentials first. Use /help to see the available commands.")
+            return
+
+        missing_credentials = []
+        for cred in ['api_id', 'api_hash', 'source']:
+            if cred not in user_data and not user_data.get(ARCHIVE_ALTERNATIVES.get(cred)):
+                missing_credentials.append(cred.replace('_', ' ').title())
+
+        if missing_credentials:
+            missing_cred_str = ", ".join(missing_credentials)
+            logger.warning(f"User {user_id} attempted to plan with missing credentials: {missing_cred_str}")
+            await event.reply(f"Please set up the following before planning: {missing_cred_str}. Use /help for instructions.")
+            return
+
+        source_channel = None
+        try:
+            await forwarder.ensure_user_client_started(user_data)
+            source_channel = await forwarder.resolve_source(user_data)
+            await event.reply(f"Scanning message IDs {start_id} to {end_id}. This doesn't forward anything.")
+            metadata = await planner.scan_range(forwarder, db, user_id, source_channel, start_id, end_id,
+                                                user_data.get('source_archive'))
+        except ValueError:
+            await event.reply("Error: Invalid source channel.")
+            return
+        except Exception as e:
+            logger.error(f"Unexpected error in plan_command: {str(e)}", exc_info=True)
+            await event.reply("An unexpected error occurred. Please try again later.")
+            return
+        finally:
+            if isinstance(source_channel, MessageArchive):
+                source_channel.close()
+
+        estimates = planner.estimate(metadata, forwarder.max_forward_batch, forwarder.forward_delay_min, forwarder.forward_delay_max,
+                                     forwarder.rate_limiter.period)
+        report = planner.format_plan(metadata, estimates)
+        if user_data.get('archive_path'):
+            report += "\n\nNote: the destination is a local archive; estimates assume forwarding to a channel."
+        logger.info(f"User {user_id} planned message IDs {start_id} to {end_id}")
+        await event.reply(report)
+
+        # The recorded metadata can be re-simulated offline with: python planner.py <file>
+        metadata_file = io.BytesIO(planner.dump_metadata(metadata))
+        metadata_file.name = f'plan_{start_id}_{end_id}.jsonl'
+        await bot.send_file(event.chat_id, metadata_file, caption="Recorded range metadata for offline planning")
+
+    @bot.on(events.NewMessage(pattern='/profile'))
+    async def profile_command(event):
+        user_id = event.sender_id
+        if user_id not in config.ADMIN_IDS:
+            logger.warning(f"User {user_id} attempted to use /profile without admin rights")
+            return
+
+        try:
+            parts = event.text.split()
+            duration = int(parts[1]) if len(parts) > 1 else 10
+            if not 1 <= duration <= 300:
+                raise ValueError("Duration must be between 1 and 300 seconds")
+        except ValueError as e:
+            await event.reply(f"Invalid command format. Use: /profile [seconds]. {str(e)}")
+            return
+
+        if loop_profiler.running:
+            await event.reply("A profile is already running. Please wait for it to finish.")
+            return
+
+        logger.info(f"Admin {user_id} started a {duration}s event loop profile")
+        await event.reply(f"Profiling the event loop for {duration} seconds...")
+        try:
+            files = await loop_profiler.profile_to_files(duration)
+            await bot.send_file(event.chat_id, files, caption="Event loop profile (report and folded stacks for flame graphs)")
+        except ProfilerBusyError:
+            # Another /profile started while this one was replying
+            await event.reply("A profile is already running. Please wait for it to finish.")
+        except Exception as e:
+            logger.error(f"Unexpected error in profile_command: {str(e)}", exc_info=True)
+            await event.reply("An unexpected error occurred while profiling.")
 
     logger.info("Commands set up successfully")
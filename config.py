@@ -13,8 +13,14 @@ class Config(BaseModel):
     FORWARD_DELAY_MAX: int = 120
     MONGODB_URI: str
     DB_NAME: str
+    IDEMPOTENT_FORWARDING: bool = False
+    ADMIN_IDS: list[int] = []
+    HEALTH_HOST: str = '127.0.0.1'
+    HEALTH_PORT: int = 8080
+    ARCHIVE_ROOT: str = 'archives'
+    MAX_PLAN_RANGE: int = 10000
 
-    @field_validator('API_ID', 'MAX_FORWARD_BATCH', 'FORWARD_DELAY_MIN', 'FORWARD_DELAY_MAX')
+    @field_validator('API_ID', 'MAX_FORWARD_BATCH', 'FORWARD_DELAY_MIN', 'FORWARD_DELAY_MAX', 'HEALTH_PORT', 'MAX_PLAN_RANGE')
     def must_be_int(cls, v):
         if not isinstance(v, int):
             raise ValueError('must be an integer')
@@ -32,7 +38,13 @@ def load_config():
             FORWARD_DELAY_MIN=int(os.getenv('FORWARD_DELAY_MIN', 60)),
             FORWARD_DELAY_MAX=int(os.getenv('FORWARD_DELAY_MAX', 120)),
             MONGODB_URI=os.getenv('MONGODB_URI'),
-            DB_NAME=os.getenv('DB_NAME')
+            DB_NAME=os.getenv('DB_NAME'),
+            IDEMPOTENT_FORWARDING=os.getenv('IDEMPOTENT_FORWARDING', 'false').lower() in ('1', 'true', 'yes'),
+            ADMIN_IDS=[int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id.strip()],
+            HEALTH_HOST=os.getenv('HEALTH_HOST', '127.0.0.1'),
+            HEALTH_PORT=int(os.getenv('HEALTH_PORT', 8080)),
+            ARCHIVE_ROOT=os.getenv('ARCHIVE_ROOT', 'archives'),
+            MAX_PLAN_RANGE=int(os.getenv('MAX_PLAN_RANGE', 10000))
         )
     except ValueError as e:
         raise ValueError(f"Configuration error: {e}")
@@ -1,10 +1,16 @@
 # database.py
+import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Source->destination message IDs are stored in buckets of this many source IDs per document,
+# so one forwarded batch costs a handful of upserts instead of one document per message.
+MESSAGE_MAP_BUCKET_SIZE = 1000
+
 class Database:
     def __init__(self):
         self.client = None
@@ -29,16 +35,20 @@ class Database:
             self.client.close()
             logger.info("Disconnected from MongoDB")
 
+    async def ensure_index(self, collection, name, keys):
+        indexes = await collection.index_information()
+        if name not in indexes:
+            await collection.create_index(keys, unique=True)
+
     async def ensure_indexes(self):
-        indexes = await self.db.users.index_information()
-        if 'user_id_1' not in indexes:
-            await self.db.users.create_index('user_id', unique=True)
-        indexes = await self.db.forwarded_messages.index_information()
-        if 'user_id_1_message_id_1' not in indexes:
-            await self.db.forwarded_messages.create_index([('user_id', 1), ('message_id', 1)], unique=True)
-        indexes = await self.db.forwarded_filenames.index_information()
-        if 'user_id_1_filename_1' not in indexes:
-            await self.db.forwarded_filenames.create_index([('user_id', 1), ('filename', 1)], unique=True)
+        # Each collection is checked independently, so the round trips can overlap
+        await asyncio.gather(
+            self.ensure_index(self.db.users, 'user_id_1', 'user_id'),
+            self.ensure_index(self.db.forwarded_messages, 'user_id_1_message_id_1', [('user_id', 1), ('message_id', 1)]),
+            self.ensure_index(self.db.replayed_messages, 'user_id_1_archive_1_message_id_1', [('user_id', 1), ('archive', 1), ('message_id', 1)]),
+            self.ensure_index(self.db.forwarded_filenames, 'user_id_1_filename_1', [('user_id', 1), ('filename', 1)]),
+            self.ensure_index(self.db.message_map, 'user_id_1_source_1_destination_1_bucket_1', [('user_id', 1), ('source', 1), ('destination', 1), ('bucket', 1)]),
+        )
 
     async def save_user_credentials(self, user_id, credentials):
         try:
@@ -98,11 +108,18 @@ class Database:
             logger.error(f"Failed to get user credentials: {str(e)}", exc_info=True)
             raise
 
-    async def mark_message_as_forwarded(self, user_id, message_id):
+    def _forwarded_scope(self, user_id, archive=None):
+        # Replays from an archive are tracked per archive, so a range that was both forwarded
+        # and archived can still be replayed from the archive later
+        if archive:
+            return self.db.replayed_messages, {'user_id': user_id, 'archive': archive}
+        return self.db.forwarded_messages, {'user_id': user_id}
+
+    async def mark_message_as_forwarded(self, user_id, message_id, archive=None):
         try:
-            forwarded_messages = self.db.forwarded_messages
+            forwarded_messages, scope = self._forwarded_scope(user_id, archive)
             await forwarded_messages.update_one(
-                {'user_id': user_id, 'message_id': message_id},
+                dict(scope, message_id=message_id),
                 {'$set': {'forwarded': True}},
                 upsert=True
             )
@@ -110,15 +127,27 @@ class Database:
             logger.error(f"Failed to mark message as forwarded: {str(e)}", exc_info=True)
             raise
 
-    async def is_message_forwarded(self, user_id, message_id):
+    async def is_message_forwarded(self, user_id, message_id, archive=None):
         try:
-            forwarded_messages = self.db.forwarded_messages
-            result = await forwarded_messages.find_one({'user_id': user_id, 'message_id': message_id, 'forwarded': True})
+            forwarded_messages, scope = self._forwarded_scope(user_id, archive)
+            result = await forwarded_messages.find_one(dict(scope, message_id=message_id, forwarded=True))
             return result is not None
         except Exception as e:
             logger.error(f"Failed to check if message is forwarded: {str(e)}", exc_info=True)
             raise
 
+    async def get_forwarded_message_ids(self, user_id, message_ids, archive=None):
+        try:
+            forwarded_messages, scope = self._forwarded_scope(user_id, archive)
+            cursor = forwarded_messages.find(
+                dict(scope, message_id={'$in': list(message_ids)}, forwarded=True),
+                {'message_id': 1}
+            )
+            return {document['message_id'] async for document in cursor}
+        except Exception as e:
+            logger.error(f"Failed to get forwarded message IDs: {str(e)}", exc_info=True)
+            raise
+
     async def mark_filename_as_forwarded(self, user_id, filename):
         try:
             forwarded_filenames = self.db.forwarded_filenames
@@ -140,6 +169,66 @@ class Database:
             logger.error(f"Failed to check if filename is forwarded: {str(e)}", exc_info=True)
             raise
 
+    async def save_message_id_map(self, user_id, source, destination, id_map):
+        try:
+            buckets = {}
+            for source_id, destination_id in id_map.items():
+                bucket, offset = divmod(int(source_id), MESSAGE_MAP_BUCKET_SIZE)
+                buckets.setdefault(bucket, {})[f'ids.{offset}'] = int(destination_id)
+            if not buckets:
+                return
+            operations = [
+                UpdateOne(
+                    {'user_id': user_id, 'source': int(source), 'destination': int(destination), 'bucket': bucket},
+                    {'$set': fields},
+                    upsert=True
+                )
+                for bucket, fields in buckets.items()
+            ]
+            await self.db.message_map.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to save message ID map: {str(e)}", exc_info=True)
+            raise
+
+    async def get_message_id_map(self, user_id, source, destination, source_ids):
+        try:
+            wanted = {}
+            for source_id in source_ids:
+                bucket, offset = divmod(int(source_id), MESSAGE_MAP_BUCKET_SIZE)
+                wanted.setdefault(bucket, set()).add(offset)
+            if not wanted:
+                return {}
+            projection = {'bucket': 1}
+            for offsets in wanted.values():
+                for offset in offsets:
+                    projection[f'ids.{offset}'] = 1
+            cursor = self.db.message_map.find(
+                {'user_id': user_id, 'source': int(source), 'destination': int(destination), 'bucket': {'$in': list(wanted)}},
+                projection
+            )
+            id_map = {}
+            async for document in cursor:
+                bucket = document['bucket']
+                for offset, destination_id in document.get('ids', {}).items():
+                    if int(offset) in wanted[bucket]:
+                        id_map[bucket * MESSAGE_MAP_BUCKET_SIZE + int(offset)] = destination_id
+            return id_map
+        except Exception as e:
+            logger.error(f"Failed to get message ID map: {str(e)}", exc_info=True)
+            raise
+
+    async def get_forwarded_filenames(self, user_id, filenames):
+        try:
+            forwarded_filenames = self.db.forwarded_filenames
+            cursor = forwarded_filenames.find(
+                {'user_id': user_id, 'filename': {'$in': list(filenames)}, 'forwarded': True},
+                {'filename': 1}
+            )
+            return {document['filename'] async for document in cursor}
+        except Exception as e:
+            logger.error(f"Failed to get forwarded filenames: {str(e)}", exc_info=True)
+            raise
+
     async def update_forwarding_progress(self, user_id, messages_forwarded, current_id):
         try:
             users_collection = self.db.users
@@ -162,4 +251,13 @@ class Database:
             logger.error(f"Failed to get active users: {str(e)}", exc_info=True)
             raise
 
+    async def get_syncing_users(self):
+        try:
+            users_collection = self.db.users
+            syncing_users = await users_collection.find({'syncing': True}).to_list(length=None)
+            return [user['user_id'] for user in syncing_users]
+        except Exception as e:
+            logger.error(f"Failed to get syncing users: {str(e)}", exc_info=True)
+            raise
+
 db = Database()
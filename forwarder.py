@@ -1,11 +1,16 @@
 import asyncio
+import hashlib
 import logging
+import os
+import random
 from telethon import types
 from telethon.helpers import generate_random_long
-from telethon.errors import FloodWaitError, MessageIdInvalidError, MessageTooLongError, ChatWriteForbiddenError
-from telethon.tl.types import MessageMediaWebPage, MessageService
-from telethon.tl.functions.messages import ForwardMessagesRequest
+from telethon.errors import FloodWaitError, MessageIdInvalidError, MessageTooLongError, ChatWriteForbiddenError, RandomIdDuplicateError
+from telethon.tl.types import MessageService
+from telethon.tl.functions.messages import ForwardMessagesRequest, SendMessageRequest
 from rate_limiter import UserRateLimiter
+from archive import ArchivedMessage, MessageArchive, resolve_archive_path
+from message_descriptor import MessageDescriptor
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +23,17 @@ class Forwarder:
         self.max_forward_batch = config.MAX_FORWARD_BATCH
         self.forward_delay_min = config.FORWARD_DELAY_MIN
         self.forward_delay_max = config.FORWARD_DELAY_MAX
+        self.idempotent_forwarding = config.IDEMPOTENT_FORWARDING
+        self.archive_root = config.ARCHIVE_ROOT
         self.forwarding_tasks = {}  # Dictionary to keep track of forwarding tasks
 
-    def generate_random_id(self):
-        return generate_random_long()
+    def generate_random_id(self, user_id=None, source_id=None, message_id=None, destination_id=None):
+        # In idempotent mode the random_id is derived from the job and message identity, so a
+        # resend after a crash reuses the same random_id and Telegram rejects it as a duplicate.
+        if not self.idempotent_forwarding or message_id is None:
+            return generate_random_long()
+        key = f"{user_id}:{source_id}:{message_id}:{destination_id}".encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big', signed=True) or 1
 
     async def validate_channel(self, channel_id):
         try:
@@ -42,14 +54,86 @@ class Forwarder:
             await self.user_client.start(user_data['api_id'], user_data['api_hash'], user_data.get('session_string'))
             logger.info("User client started successfully in ensure_user_client_started")
 
-    async def forward_message(self, message, destination_channel):
+    async def resolve_source(self, user_data):
+        if user_data.get('source_archive'):
+            path = resolve_archive_path(self.archive_root, user_data['user_id'], user_data['source_archive'])
+            if not os.path.isdir(path):
+                raise ValueError(f"Archive {user_data['source_archive']} does not exist")
+            return MessageArchive(path)
+        return await self.validate_channel(user_data['source'])
+
+    async def fetch_batch(self, source_channel, message_ids, project=True):
+        # Only the returned descriptors outlive this call; the full Telethon objects are freed on return
+        if isinstance(source_channel, MessageArchive):
+            messages = source_channel.get_messages(message_ids)
+            project = False  # Archived messages are already slim
+        else:
+            messages = await self.user_client.client.get_messages(source_channel, ids=message_ids)
+
+        batch = []
+        for message in messages:
+            if message is None or isinstance(message, MessageService):
+                continue
+            batch.append(MessageDescriptor.from_message(message) if project else message)
+        logger.debug("Fetched %d of %d messages starting at ID %d", len(batch), len(message_ids), message_ids[0])
+        return batch
+
+    async def replay_archived_message(self, message, destination_channel):
+        if message.media_path:
+            return await self.user_client.client.send_file(destination_channel, message.media_path, caption=message.text,
+                                                           formatting_entities=message.entities)
+        return await self.user_client.client.send_message(destination_channel, message.text, formatting_entities=message.entities)
+
+    async def get_forwarded_filenames(self, messages):
+        """Batched filename dedup lookup: the (sender, filename) pairs already forwarded among `messages`."""
+        filenames_by_sender = {}
+        for message in messages:
+            if message.forwardable_media and message.filename:
+                filenames_by_sender.setdefault(message.sender_id, set()).add(message.filename)
+        forwarded = set()
+        for sender_id, filenames in filenames_by_sender.items():
+            forwarded.update((sender_id, filename) for filename in await self.db.get_forwarded_filenames(sender_id, filenames))
+        return forwarded
+
+    def find_sent_message(self, result, log_extra):
+        for update in result.updates:
+            if isinstance(update, types.UpdateNewChannelMessage):
+                return update.message
+        update_types = [type(update).__name__ for update in result.updates]
+        logger.error("No 'UpdateNewChannelMessage' found in updates: %s", update_types, extra=log_extra)
+        raise AttributeError(f"No 'UpdateNewChannelMessage' found in updates: {update_types}")
+
+    async def report_unmapped(self, user_id, user_data, message_ids, log_extra):
+        """Count messages of an interrupted batch that were marked forwarded before their destination IDs were flushed."""
+        forwarded_ids = await self.db.get_forwarded_message_ids(user_id, message_ids)
+        if not forwarded_ids:
+            return 0
+        id_map = await self.db.get_message_id_map(user_id, user_data['source'], user_data['destination'], forwarded_ids)
+        unmapped = sorted(forwarded_ids - set(id_map))
+        if unmapped:
+            logger.warning("%d messages forwarded before the restart have no destination ID mapping; edit/delete sync won't reach them: %s",
+                           len(unmapped), unmapped, extra=dict(log_extra, event='unmapped_after_restart'))
+        return len(unmapped)
+
+    async def forward_message(self, message, destination_channel, user_id=None, forwarded_filenames=None):
+        log_extra = {'job': user_id, 'account': self.user_client.account_id, 'message_id': message.id}
         try:
+            if isinstance(destination_channel, MessageArchive):
+                return await destination_channel.archive_message(self.user_client.client, message)
+            if isinstance(message, ArchivedMessage):
+                return await self.replay_archived_message(message, destination_channel)
+
             filename = None
-            if message.media and not isinstance(message.media, MessageMediaWebPage):
-                if hasattr(message.media, 'document'):
-                    filename = message.media.document.attributes[0].file_name
-                    if await self.db.is_filename_forwarded(message.sender_id, filename):
-                        logger.warning(f"Duplicate filename detected: {filename}. Skipping.")
+            if message.forwardable_media:
+                if message.filename:
+                    filename = message.filename
+                    # A prefetched set replaces the per-message lookup while replaying a batch
+                    if forwarded_filenames is not None:
+                        duplicate = (message.sender_id, filename) in forwarded_filenames
+                    else:
+                        duplicate = await self.db.is_filename_forwarded(message.sender_id, filename)
+                    if duplicate:
+                        logger.warning("Duplicate filename detected: %s. Skipping.", filename, extra=dict(log_extra, event='duplicate_filename'))
                         return None
                 
                 from_peer = await self.user_client.client.get_input_entity(message.peer_id)
@@ -59,38 +143,43 @@ class Forwarder:
                     from_peer=from_peer,
                     id=[message.id],
                     to_peer=to_peer,
-                    random_id=[self.generate_random_id()],
+                    random_id=[self.generate_random_id(user_id, getattr(from_peer, 'channel_id', None), message.id, getattr(to_peer, 'channel_id', None))],
                     drop_author=True
                 ))
                 
-                sent_message = None
-                for update in result.updates:
-                    if isinstance(update, types.UpdateNewChannelMessage):
-                        sent_message = update.message
-                        break
-                
-                if not sent_message:
-                    logger.error(f"No 'UpdateNewChannelMessage' found in updates. Result: {result.to_dict()}")
-                    raise AttributeError(f"No 'UpdateNewChannelMessage' found in updates. Result: {result.to_dict()}")
+                sent_message = self.find_sent_message(result, log_extra)
                 
                 if filename:
                     await self.db.mark_filename_as_forwarded(message.sender_id, filename)
+                    if forwarded_filenames is not None:
+                        forwarded_filenames.add((message.sender_id, filename))
             else:
-                sent_message = await self.user_client.client.send_message(destination_channel, message.text or "")
+                # Text goes out with a random_id too, so a replayed text message is dropped by Telegram like media
+                to_peer = await self.user_client.client.get_input_entity(destination_channel)
+                result = await self.user_client.client(SendMessageRequest(
+                    peer=to_peer,
+                    message=message.text or "",
+                    entities=message.entities,
+                    random_id=self.generate_random_id(user_id, getattr(message.peer_id, 'channel_id', None), message.id, getattr(to_peer, 'channel_id', None))
+                ))
+                sent_message = self.find_sent_message(result, log_extra)
             
             return sent_message
         except MessageTooLongError:
             truncated_text = (message.text or "")[:4096]
-            logger.warning(f"Message too long, truncating: {truncated_text[:50]}...")
-            return await self.user_client.client.send_message(destination_channel, truncated_text)
+            logger.warning("Message too long, truncating: %.50s...", truncated_text, extra=log_extra)
+            # Entity offsets may point past the cut, so the truncated copy is sent unformatted
+            return await self.user_client.client.send_message(destination_channel, truncated_text, parse_mode=None)
+        except RandomIdDuplicateError:
+            raise
         except ChatWriteForbiddenError:
             logger.error(f"Write permissions are not available in the destination channel: {destination_channel}")
             raise
         except Exception as e:
-            logger.error(f"Error in forward_message: {str(e)}", exc_info=True)
+            logger.error("Error in forward_message: %s", e, exc_info=True, extra=log_extra)
             raise
 
-    async def forward_messages(self, user_id, bot, db, progress_message, start_id=None, end_id=None):
+    async def forward_messages(self, user_id, bot, db, progress_message, start_id=None, end_id=None, resumed=False):
         logger.info(f"Starting forwarding process for user {user_id}")
         user_data = await db.get_user_credentials(user_id)
 
@@ -115,14 +204,44 @@ class Forwarder:
         skipped_messages = []
         last_progress_content = ""
         messages_processed = 0  # Counter for processed messages
+        log_extra = {'job': user_id, 'account': self.user_client.account_id}
+        if progress_message is None:
+            # Jobs resumed at startup have no command message to edit, so start a new one
+            progress_message = await bot.send_message(user_id, f"Resuming forwarding from message ID {current_id} to {end_id}.")
+        id_map = {}  # Source message ID -> destination message ID, flushed once per batch
 
+        source_channel = None
         try:
-            source_channel = await self.validate_channel(user_data['source'])
-            destination_channel = await self.validate_channel(user_data['destination'])
+            source_channel = await self.resolve_source(user_data)
+            if user_data.get('archive_path'):
+                destination_channel = MessageArchive(resolve_archive_path(self.archive_root, user_id, user_data['archive_path']))
+            else:
+                destination_channel = await self.validate_channel(user_data['destination'])
         except ValueError:
             await bot.edit_message(user_id, progress_message.id, "Error: Invalid source or destination channel.")
             await db.save_user_credentials(user_id, {'forwarding': False})
             return
+        except OSError as e:
+            logger.error(f"Cannot open archive for user {user_id}: {str(e)}")
+            if isinstance(source_channel, MessageArchive):
+                source_channel.close()
+            await bot.edit_message(user_id, progress_message.id, "Error: The archive could not be opened.")
+            await db.save_user_credentials(user_id, {'forwarding': False})
+            return
+
+        # The message ID map only makes sense between two Telegram channels
+        record_id_map = not isinstance(source_channel, MessageArchive) and not isinstance(destination_channel, MessageArchive)
+        # The first batch of a resumed job may have been forwarded without being checkpointed.
+        # With deterministic random_ids it can be replayed blindly: Telegram drops the duplicates.
+        # Fresh jobs always pre-check, since Telegram's random_id retention isn't guaranteed.
+        replaying = resumed and self.idempotent_forwarding and record_id_map
+        # Replays from an archive keep their own dedup records, apart from channel forwarding
+        replay_archive = user_data.get('source_archive') if isinstance(source_channel, MessageArchive) else None
+        if resumed and record_id_map and not replaying:
+            # ID map entries are flushed once per batch, so a crash loses those of the batch it interrupted.
+            # (A blind replay reports the same messages one by one as unmapped_replay.)
+            interrupted_batch_ids = list(range(current_id, min(current_id + self.max_forward_batch, end_id + 1)))
+            await self.report_unmapped(user_id, user_data, interrupted_batch_ids, log_extra)
 
         try:
             while user_data['forwarding'] and current_id <= end_id:
@@ -132,48 +251,66 @@ class Forwarder:
                     logger.info(f"Stopping forwarding for user {user_id} as requested.")
                     break
 
-                logger.debug(f"Fetching messages from {current_id} to {min(current_id + self.max_forward_batch, end_id + 1)}")
+                logger.debug("Fetching messages from %d to %d", current_id, min(current_id + self.max_forward_batch, end_id + 1), extra=log_extra)
                 batch_message_ids = list(range(current_id, min(current_id + self.max_forward_batch, end_id + 1)))
-                batch_messages = await self.user_client.client.get_messages(source_channel, ids=batch_message_ids)
-                if not batch_messages:
-                    logger.warning(f"No messages found in the range {current_id} to {min(current_id + self.max_forward_batch, end_id + 1)}")
-                    break
+                # The archive sink downloads media itself, so it needs the full message objects
+                batch_messages = await self.fetch_batch(source_channel, batch_message_ids, project=not isinstance(destination_channel, MessageArchive))
+                # A blind replay skips the per-message Mongo checks; filename dedup becomes one lookup per batch
+                replay_filenames = await self.get_forwarded_filenames(batch_messages) if replaying else None
 
                 for message in batch_messages:
-                    if message is None:
-                        logger.warning(f"Received None message in batch for message ID {current_id}")
-                        current_id += 1
-                        continue
-                    
-                    logger.debug(f"Processing message ID {message.id}")
-                    if message and not isinstance(message, MessageService) and not await self.db.is_message_forwarded(user_id, message.id):
-                        logger.debug(f"Message ID {message.id} is not forwarded yet and is not a service message")
+                    blind_replay = False
+                    logger.debug("Processing message ID %d", message.id, extra=log_extra)
+                    if isinstance(destination_channel, MessageArchive):
+                        # Archives dedup against their own index, so archiving a range never blocks replaying it later
+                        already_forwarded = destination_channel.contains(message.id)
+                    else:
+                        # Media and text both carry a deterministic random_id, so neither needs the pre-check
+                        blind_replay = replaying
+                        already_forwarded = not blind_replay and await self.db.is_message_forwarded(user_id, message.id, replay_archive)
+                    if not already_forwarded:
+                        logger.debug("Message ID %d is not forwarded yet and is not a service message", message.id, extra=log_extra)
                         for retry in range(self.max_retries):
                             try:
                                 await self.rate_limiter.wait(user_id)
-                                sent_message = await self.forward_message(message, destination_channel)
+                                sent_message = await self.forward_message(message, destination_channel, user_id,
+                                                                          replay_filenames if blind_replay else None)
                                 if sent_message:
-                                    await self.db.mark_message_as_forwarded(user_id, message.id)
+                                    if not isinstance(destination_channel, MessageArchive):
+                                        await self.db.mark_message_as_forwarded(user_id, message.id, replay_archive)
                                     messages_forwarded += 1
                                     messages_processed += 1
-                                    logger.info(f"Message ID {message.id} forwarded successfully as new message ID {sent_message.id}")
+                                    if record_id_map:
+                                        id_map[message.id] = sent_message.id
+                                    logger.info("Message ID %d forwarded successfully as new message ID %d", message.id, sent_message.id,
+                                                extra=dict(log_extra, event='message_forwarded', message_id=message.id))
+                                break
+                            except RandomIdDuplicateError:
+                                logger.info("Message ID %d was already forwarded before restart. Skipping.", message.id,
+                                            extra=dict(log_extra, event='duplicate_random_id', message_id=message.id))
+                                await self.db.mark_message_as_forwarded(user_id, message.id, replay_archive)
+                                messages_forwarded += 1
+                                # Telegram doesn't return the earlier copy, so there is no destination ID to map
+                                logger.warning("Message ID %d has no destination ID mapping; edit/delete sync won't reach it", message.id,
+                                               extra=dict(log_extra, event='unmapped_replay', message_id=message.id))
                                 break
                             except FloodWaitError as fwe:
-                                logger.warning(f"FloodWaitError: Waiting for {fwe.seconds} seconds")
+                                logger.warning("FloodWaitError: Waiting for %d seconds", fwe.seconds, extra=log_extra)
                                 await asyncio.sleep(fwe.seconds)
                             except MessageIdInvalidError:
-                                logger.warning(f"Invalid message ID: {message.id}. Skipping.")
+                                logger.warning("Invalid message ID: %d. Skipping.", message.id, extra=dict(log_extra, event='invalid_message_id'))
                                 break
                             except ChatWriteForbiddenError:
                                 logger.error(f"Write permissions are not available in the destination channel: {user_data['destination']}")
                                 return
                             except Exception as e:
-                                logger.error(f"Error forwarding message {message.id}: {str(e)}", exc_info=True)
+                                logger.error("Error forwarding message %d: %s", message.id, e, exc_info=True, extra=dict(log_extra, event='forward_error'))
                                 if retry == self.max_retries - 1:
                                     break
                         await asyncio.sleep(random.randint(0, 1))
 
                 current_id += self.max_forward_batch
+                replaying = False
 
                 if messages_processed >= self.max_forward_batch:
                     delay = random.randint(self.forward_delay_min, self.forward_delay_max)
@@ -181,6 +318,9 @@ class Forwarder:
                     await asyncio.sleep(delay)
                     messages_processed = 0
 
+                if id_map:
+                    await db.save_message_id_map(user_id, user_data['source'], user_data['destination'], id_map)
+                    id_map = {}
                 await db.update_forwarding_progress(user_id, messages_forwarded, current_id)
                 progress_percentage = (messages_forwarded / total_messages) * 100
                 progress_content = f"Forwarding progress: {progress_percentage:.2f}% ({messages_forwarded}/{total_messages})"
@@ -203,6 +343,11 @@ class Forwarder:
         except asyncio.CancelledError:
             logger.info(f"Forwarding task for user {user_id} was cancelled.")
         finally:
+            if id_map:
+                await db.save_message_id_map(user_id, user_data['source'], user_data['destination'], id_map)
+            for channel in (source_channel, destination_channel):
+                if isinstance(channel, MessageArchive):
+                    channel.close()
             await db.save_user_credentials(user_id, {'forwarding': False})
             if user_id in self.forwarding_tasks:
                 del self.forwarding_tasks[user_id]
@@ -223,7 +368,7 @@ class Forwarder:
 
     async def process_user_queue(self, user_id, bot, db, progress_message):
         logger.info(f"Processing queue for user {user_id}")
-        task = asyncio.create_task(self.forward_messages(user_id, bot, db, progress_message))
+        task = asyncio.create_task(self.forward_messages(user_id, bot, db, progress_message, resumed=True))
         self.forwarding_tasks[user_id] = task
         try:
             await task
@@ -0,0 +1,59 @@
+# health.py
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class StartupStatus:
+    """Tracks the startup phases so a local probe can tell when the bot is ready to serve."""
+
+    def __init__(self, phases):
+        self.started = time.monotonic()
+        self.phases = {phase: {'state': 'pending'} for phase in phases}
+
+    def begin(self, phase):
+        self.phases[phase] = {'state': 'running', 'started': round(time.monotonic() - self.started, 3)}
+
+    def done(self, phase):
+        self.phases[phase].update(state='ready', finished=round(time.monotonic() - self.started, 3))
+
+    def fail(self, phase, error):
+        self.phases[phase].update(state='failed', error=str(error))
+
+    async def track(self, phase, coro):
+        self.begin(phase)
+        try:
+            result = await coro
+        except Exception as e:
+            self.fail(phase, e)
+            raise
+        self.done(phase)
+        return result
+
+    @property
+    def ready(self):
+        return all(phase['state'] == 'ready' for phase in self.phases.values())
+
+    def to_dict(self):
+        return {'ready': self.ready, 'uptime': round(time.monotonic() - self.started, 3), 'phases': self.phases}
+
+async def start_health_server(status, host='127.0.0.1', port=8080):
+    async def handle(reader, writer):
+        try:
+            await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            body = json.dumps(status.to_dict()).encode('utf-8')
+            code = '200 OK' if status.ready else '503 Service Unavailable'
+            writer.write(
+                f"HTTP/1.1 {code}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Health endpoint listening on http://{host}:{port}/")
+    return server
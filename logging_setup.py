@@ -0,0 +1,106 @@
+# logging_setup.py
+import copy
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Extra fields copied from log records into the JSON output when present
+STRUCTURED_FIELDS = ('job', 'account', 'event', 'message_id', 'suppressed')
+
+# Immutable argument types that are safe to format later on the listener thread
+PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Lets through at most `max_records` records per (event, job) every `period` seconds.
+
+    Only records logged with an `event` extra are sampled; the first record of each new window
+    carries a `suppressed` count of what was dropped in the previous one.
+    """
+
+    def __init__(self, max_records=20, period=60):
+        super().__init__()
+        self.max_records = max_records
+        self.period = period
+        self.windows = {}  # (event, job) -> [window start, records passed, records suppressed]
+        self.last_prune = time.monotonic()
+
+    def prune(self, now):
+        # Drop expired windows so finished jobs don't accumulate; a pending suppressed count is kept
+        # for one more period so the next record of that event can still report it
+        self.windows = {
+            key: window for key, window in self.windows.items()
+            if now - window[0] < self.period or (window[2] and now - window[0] < 2 * self.period)
+        }
+        self.last_prune = now
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None:
+            return True
+        key = (event, getattr(record, 'job', None))
+        now = time.monotonic()
+        if now - self.last_prune >= self.period:
+            self.prune(now)
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.period:
+            if window and window[2]:
+                record.suppressed = window[2]
+            window = self.windows[key] = [now, 0, 0]
+        if window[1] >= self.max_records:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Records with only immutable arguments are formatted later on the listener thread. Anything
+        # else (TL objects, dicts) may change on the event loop meanwhile, so it is rendered now, as
+        # the stdlib QueueHandler does for every record.
+        record = copy.copy(record)
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if record.args and not all(isinstance(arg, PRIMITIVE_TYPES) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Tracebacks reference live frames, so render them on the loop thread too
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging(level=logging.INFO, max_records=20, period=60):
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(max_records, period))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
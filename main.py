@@ -4,10 +4,13 @@ from bot_client import BotClient
 from user_client import UserClient
 from commands import setup_commands
 from forwarder import Forwarder
+from sync import MessageSync
 from config import load_config
 from database import db
+from logging_setup import setup_logging
+from health import StartupStatus, start_health_server
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_listener = setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 logging.getLogger('telethon').setLevel(logging.WARNING)
@@ -17,31 +20,58 @@ logging.getLogger('telethon.network.connection.connection').setLevel(logging.WAR
 async def main():
     bot = None
     user_client = None
+    health_server = None
+    resume_tasks = set()
+    status = StartupStatus(['config', 'database', 'bot', 'commands', 'resume'])
     try:
+        status.begin('config')
         config = load_config()
+        status.done('config')
         logger.info("Configuration loaded successfully")
-        
-        await db.connect()
-        logger.info("Connected to MongoDB")
 
+        try:
+            health_server = await start_health_server(status, config.HEALTH_HOST, config.HEALTH_PORT)
+        except OSError as e:
+            # The health endpoint is optional; a taken port must never keep the bot from serving
+            logger.error(f"Failed to start health endpoint on {config.HEALTH_HOST}:{config.HEALTH_PORT}: {str(e)}")
+
+        # The database and the bot login don't depend on each other, so do both round trips at once
         bot = BotClient(config)
-        await bot.start()
-        logger.info("Bot client started successfully")
+        await asyncio.gather(
+            status.track('database', db.connect()),
+            status.track('bot', bot.start()),
+        )
+        logger.info("Connected to MongoDB and started bot client")
 
+        # The user client only connects when a job needs it (see Forwarder.ensure_user_client_started)
         user_client = UserClient()
         forwarder = Forwarder(user_client, db, config)
+        message_sync = MessageSync(user_client, forwarder, db)
 
-        setup_commands(bot, user_client, forwarder, db)
+        status.begin('commands')
+        setup_commands(bot, user_client, forwarder, db, message_sync, config)
+        status.done('commands')
         logger.info("Commands set up successfully")
 
+        status.begin('resume')
         active_users = await db.get_active_users()
         logger.info(f"Active users: {active_users}")
 
-        tasks = [forwarder.process_user_queue(user_id, bot, db, None) for user_id in active_users]
-        logger.info(f"Created {len(tasks)} tasks for active users")
-        
-        await asyncio.gather(*tasks)
-        logger.info("All tasks have been processed")
+        # Resumed jobs run in the background so the bot starts serving commands right away
+        for user_id in active_users:
+            task = asyncio.create_task(forwarder.process_user_queue(user_id, bot, db, None))
+            resume_tasks.add(task)
+            task.add_done_callback(resume_tasks.discard)
+        logger.info(f"Resumed {len(resume_tasks)} forwarding jobs in the background")
+
+        # Sync jobs only live in memory, so restart the ones that were running before the restart
+        syncing_users = await db.get_syncing_users()
+        for user_id in syncing_users:
+            task = asyncio.create_task(message_sync.resume_sync(user_id))
+            resume_tasks.add(task)
+            task.add_done_callback(resume_tasks.discard)
+        status.done('resume')
+        logger.info(f"Resuming {len(syncing_users)} sync jobs in the background")
 
         await bot.run_until_disconnected()
     except asyncio.CancelledError:
@@ -49,6 +79,10 @@ async def main():
     except Exception as e:
         logger.error(f"An error occurred in main: {str(e)}", exc_info=True)
     finally:
+        for task in list(resume_tasks):
+            task.cancel()
+        if health_server:
+            health_server.close()
         if bot:
             await bot.disconnect()
         if user_client and user_client.client:
@@ -61,3 +95,5 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Process interrupted by user.")
+    finally:
+        log_listener.stop()
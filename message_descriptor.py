@@ -0,0 +1,62 @@
+# message_descriptor.py
+from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto, MessageMediaWebPage
+
+class MessageDescriptor:
+    """The few fields the forwarder needs from a fetched message, so full Telethon objects can be dropped early."""
+    __slots__ = ('id', 'peer_id', 'sender_id', 'grouped_id', 'media_kind', 'document_id', 'size', 'filename', 'text', 'entities', 'text_length')
+
+    def __init__(self, id, peer_id, sender_id=None, grouped_id=None, media_kind=None, document_id=None, size=None, filename=None, text=None, entities=None, text_length=0):
+        self.id = id
+        self.peer_id = peer_id
+        self.sender_id = sender_id
+        self.grouped_id = grouped_id
+        self.media_kind = media_kind
+        self.document_id = document_id
+        self.size = size
+        self.filename = filename
+        self.text = text
+        self.entities = entities
+        self.text_length = text_length
+
+    @property
+    def forwardable_media(self):
+        return self.media_kind is not None and self.media_kind != 'webpage'
+
+    @classmethod
+    def from_message(cls, message):
+        media = message.media
+        media_kind = None
+        document_id = None
+        size = None
+        filename = None
+        if isinstance(media, MessageMediaDocument) and media.document:
+            media_kind = 'document'
+            document_id = media.document.id
+            size = media.document.size
+            filename = next((attr.file_name for attr in media.document.attributes if hasattr(attr, 'file_name')), None)
+        elif isinstance(media, MessageMediaDocument):
+            media_kind = 'other'  # No document object (e.g. expired); forwarded server-side as-is
+        elif isinstance(media, MessageMediaPhoto):
+            media_kind = 'photo'
+        elif isinstance(media, MessageMediaWebPage):
+            media_kind = 'webpage'
+        elif media is not None:
+            media_kind = 'other'
+
+        text = message.message or ""
+        keep_text = media_kind in (None, 'webpage')
+        return cls(
+            id=message.id,
+            peer_id=message.peer_id,
+            sender_id=message.sender_id,
+            grouped_id=message.grouped_id,
+            media_kind=media_kind,
+            document_id=document_id,
+            size=size,
+            filename=filename,
+            # Media is forwarded server-side with its caption, so only text messages keep their text,
+            # raw with its entities so it can be sent with SendMessageRequest as-is
+            text=text if keep_text else None,
+            entities=message.entities if keep_text else None,
+            text_length=len(text),
+        )
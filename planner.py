@@ -0,0 +1,190 @@
+# planner.py
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from collections import deque
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+def _record(message):
+    media_kind = getattr(message, 'media_kind', None)
+    if media_kind is None and getattr(message, 'media_path', None):
+        media_kind = 'document'  # Archived media, re-uploaded on replay
+    return {
+        'id': message.id,
+        'sender_id': getattr(message, 'sender_id', None),
+        'grouped_id': message.grouped_id,
+        'media_kind': media_kind,
+        'size': getattr(message, 'size', None),
+        'filename': message.filename,
+        'text_length': getattr(message, 'text_length', len(message.text or "")),
+    }
+
+async def scan_range(forwarder, db, user_id, source_channel, start_id, end_id, archive=None):
+    """Fetch metadata for a range with the forwarder's own fetch stage and mark what dedup would skip."""
+    records = []
+    missing = 0
+    batch_size = forwarder.max_forward_batch
+    for batch_start in range(start_id, end_id + 1, batch_size):
+        batch_message_ids = list(range(batch_start, min(batch_start + batch_size, end_id + 1)))
+        while True:
+            try:
+                batch = await forwarder.fetch_batch(source_channel, batch_message_ids)
+                break
+            except FloodWaitError as fwe:
+                logger.warning(f"FloodWaitError while planning: Waiting for {fwe.seconds} seconds")
+                await asyncio.sleep(fwe.seconds)
+        missing += len(batch_message_ids) - len(batch)
+        forwarded_ids = await db.get_forwarded_message_ids(user_id, [message.id for message in batch], archive)
+        for message in batch:
+            record = _record(message)
+            record['forwarded'] = message.id in forwarded_ids
+            records.append(record)
+
+    # Filename dedup is keyed by sender, so look the filenames up once per sender
+    records_by_sender = {}
+    for record in records:
+        if record['filename'] and record['media_kind'] not in (None, 'webpage'):
+            records_by_sender.setdefault(record['sender_id'], []).append(record)
+    for sender_id, sender_records in records_by_sender.items():
+        forwarded_filenames = await db.get_forwarded_filenames(sender_id, {record['filename'] for record in sender_records})
+        for record in sender_records:
+            record['filename_forwarded'] = record['filename'] in forwarded_filenames
+
+    # The limiter window is recorded so offline simulations use the same one as the forwarder
+    return {'start_id': start_id, 'end_id': end_id, 'missing': missing, 'rate_limit_period': forwarder.rate_limiter.period, 'records': records}
+
+def dump_metadata(metadata):
+    header = {key: metadata[key] for key in ('start_id', 'end_id', 'missing', 'rate_limit_period')}
+    lines = [json.dumps(header)] + [json.dumps(record) for record in metadata['records']]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def load_metadata(lines):
+    lines = [line for line in lines if line.strip()]
+    metadata = json.loads(lines[0])
+    metadata['records'] = [json.loads(line) for line in lines[1:]]
+    return metadata
+
+def simulate(metadata, batch_size, delay_min, delay_max, rate_limit_period, pause=0.5, delay=None, rpc_latency=0.3):
+    """Replay Forwarder.forward_messages against recorded metadata on a simulated clock.
+
+    `pause` stands in for the random 0-1s sleep after each message and `delay` for the
+    FORWARD_DELAY_MIN/MAX pause after a full batch (their mean when not given).
+    `rate_limit_period` is the window of the forwarder's UserRateLimiter.
+    """
+    if delay is None:
+        delay = (delay_min + delay_max) / 2
+    records = {record['id']: record for record in metadata['records']}
+    sent_filenames = {(record['sender_id'], record['filename']) for record in metadata['records'] if record.get('filename_forwarded')}
+
+    clock = 0.0
+    rate_limit_calls = deque()
+    user_rpcs = bot_rpcs = forwarded = filtered = batches = long_pauses = 0
+    messages_processed = 0
+    last_forwarded = None
+
+    start_id, end_id = metadata['start_id'], metadata['end_id']
+    for batch_start in range(start_id, end_id + 1, batch_size):
+        batches += 1
+        clock += rpc_latency  # get_messages
+        user_rpcs += 1
+        for message_id in range(batch_start, min(batch_start + batch_size, end_id + 1)):
+            record = records.get(message_id)
+            if record is None or record['forwarded']:
+                continue
+
+            # UserRateLimiter: at most batch_size calls per sliding window
+            while len(rate_limit_calls) >= batch_size:
+                clock = max(clock, rate_limit_calls[0] + rate_limit_period)
+                while rate_limit_calls and rate_limit_calls[0] + rate_limit_period <= clock:
+                    rate_limit_calls.popleft()
+            rate_limit_calls.append(clock)
+
+            has_media = record['media_kind'] not in (None, 'webpage')
+            filename_key = (record['sender_id'], record['filename'])
+            if has_media and record['filename'] and filename_key in sent_filenames:
+                filtered += 1
+            else:
+                clock += rpc_latency  # ForwardMessagesRequest or send_message
+                user_rpcs += 1
+                forwarded += 1
+                messages_processed += 1
+                if has_media and record['filename']:
+                    sent_filenames.add(filename_key)
+            clock += pause
+
+        if messages_processed >= batch_size:
+            clock += delay
+            long_pauses += 1
+            messages_processed = 0
+
+        if forwarded != last_forwarded:
+            clock += rpc_latency  # Progress message edit
+            bot_rpcs += 1
+            last_forwarded = forwarded
+
+    return {
+        'seconds': clock,
+        'user_rpcs': user_rpcs,
+        'bot_rpcs': bot_rpcs,
+        'forwarded': forwarded,
+        'filtered': filtered,
+        'batches': batches,
+        'long_pauses': long_pauses,
+    }
+
+def estimate(metadata, batch_size, delay_min, delay_max, rate_limit_period, rpc_latency=0.3):
+    return {
+        'best': simulate(metadata, batch_size, delay_min, delay_max, rate_limit_period, pause=0, delay=delay_min, rpc_latency=rpc_latency),
+        'expected': simulate(metadata, batch_size, delay_min, delay_max, rate_limit_period, rpc_latency=rpc_latency),
+        'worst': simulate(metadata, batch_size, delay_min, delay_max, rate_limit_period, pause=1, delay=delay_max, rpc_latency=rpc_latency),
+    }
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+def format_plan(metadata, estimates):
+    records = metadata['records']
+    media = sum(1 for record in records if record['media_kind'] not in (None, 'webpage'))
+    albums = len({record['grouped_id'] for record in records if record['grouped_id']})
+    already_forwarded = sum(1 for record in records if record['forwarded'])
+    expected = estimates['expected']
+    lines = [
+        f"Plan for message IDs {metadata['start_id']}-{metadata['end_id']}:",
+        f"Existing messages: {len(records)} (missing or service: {metadata['missing']})",
+        f"Media: {media}, albums: {albums}",
+        f"Already forwarded: {already_forwarded}, filtered as duplicate files: {expected['filtered']}",
+        f"To forward: {expected['forwarded']}",
+        "",
+        f"Estimated time: {_format_duration(expected['seconds'])} "
+        f"(best {_format_duration(estimates['best']['seconds'])}, worst {_format_duration(estimates['worst']['seconds'])})",
+        f"RPCs: {expected['user_rpcs']} user, {expected['bot_rpcs']} bot, over {expected['batches']} batches "
+        f"with {expected['long_pauses']} batch delays",
+    ]
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate a forwarding job from metadata recorded by /plan.")
+    parser.add_argument('metadata', help="JSONL file sent back by /plan")
+    parser.add_argument('--batch-size', type=int, default=100, help="MAX_FORWARD_BATCH")
+    parser.add_argument('--delay-min', type=int, default=60, help="FORWARD_DELAY_MIN")
+    parser.add_argument('--delay-max', type=int, default=120, help="FORWARD_DELAY_MAX")
+    parser.add_argument('--rpc-latency', type=float, default=0.3, help="Assumed seconds per Telegram RPC")
+    parser.add_argument('--rate-limit-period', type=float, help="Rate limiter window in seconds (default: the one recorded by /plan)")
+    args = parser.parse_args(argv)
+
+    with open(args.metadata, encoding='utf-8') as f:
+        metadata = load_metadata(f.readlines())
+    rate_limit_period = args.rate_limit_period or metadata.get('rate_limit_period')
+    if rate_limit_period is None:
+        parser.error("the metadata doesn't record a rate limiter window; pass --rate-limit-period")
+    estimates = estimate(metadata, args.batch_size, args.delay_min, args.delay_max, rate_limit_period, args.rpc_latency)
+    print(format_plan(metadata, estimates))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# profiler.py
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+class SlowCallbackCollector(logging.Handler):
+    """Collects asyncio's debug-mode "Executing <Handle ...> took N seconds" warnings."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.slow_callbacks = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith('Executing'):
+            self.slow_callbacks.append(message)
+
+class LoopProfiler:
+    """Samples the event loop thread on demand. Nothing is installed until `profile` is called."""
+
+    def __init__(self, interval=0.005, slow_callback_duration=0.1):
+        self.interval = interval
+        self.slow_callback_duration = slow_callback_duration
+        self.running = False
+
+    def _sample(self, loop, loop_thread_id, stop, stacks, coroutines):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks[';'.join(reversed(stack))] += 1
+
+            task = asyncio.current_task(loop)
+            coroutines[task.get_coro().__qualname__ if task else '<idle>'] += 1
+
+    async def profile(self, duration):
+        if self.running:
+            raise ProfilerBusyError("A profile is already running")
+        self.running = True
+
+        loop = asyncio.get_running_loop()
+        stacks = Counter()
+        coroutines = Counter()
+        stop = threading.Event()
+        collector = SlowCallbackCollector()
+        asyncio_logger = logging.getLogger('asyncio')
+        previous_debug = loop.get_debug()
+        previous_duration = loop.slow_callback_duration
+
+        sampler = threading.Thread(target=self._sample, args=(loop, threading.get_ident(), stop, stacks, coroutines), daemon=True)
+        asyncio_logger.addHandler(collector)
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback_duration
+        started = time.monotonic()
+        sampler.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+            loop.set_debug(previous_debug)
+            loop.slow_callback_duration = previous_duration
+            asyncio_logger.removeHandler(collector)
+            self.running = False
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Profiled event loop for {elapsed:.1f}s: {sum(stacks.values())} samples, {len(collector.slow_callbacks)} slow callbacks")
+        return self._folded(stacks), self._report(elapsed, stacks, coroutines, collector.slow_callbacks)
+
+    def _folded(self, stacks):
+        # Brendan Gregg's folded format, readable by flamegraph.pl and speedscope
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def _report(self, elapsed, stacks, coroutines, slow_callbacks):
+        total = sum(coroutines.values()) or 1
+        lines = [
+            f"Event loop profile: {elapsed:.1f}s, {total} samples every {self.interval * 1000:.0f}ms",
+            "",
+            "Wall time by coroutine:",
+        ]
+        for name, count in coroutines.most_common():
+            lines.append(f"  {count / total * elapsed:8.2f}s  {count / total * 100:5.1f}%  {name}")
+        lines += ["", f"Slow callbacks (> {self.slow_callback_duration * 1000:.0f}ms): {len(slow_callbacks)}"]
+        lines += [f"  {message}" for message in slow_callbacks[:50]]
+        lines += ["", "Top stacks:"]
+        for stack, count in stacks.most_common(20):
+            lines.append(f"  {count:6d}  {' <- '.join(reversed(stack.split(';')[-3:]))}")
+        return '\n'.join(lines) + '\n'
+
+    async def profile_to_files(self, duration):
+        folded, report = await self.profile(duration)
+        folded_file = io.BytesIO(folded.encode('utf-8'))
+        folded_file.name = 'loop_profile.folded'
+        report_file = io.BytesIO(report.encode('utf-8'))
+        report_file.name = 'loop_profile.txt'
+        return [report_file, folded_file]
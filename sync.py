@@ -0,0 +1,157 @@
+# sync.py
+import asyncio
+import logging
+from telethon import events
+from telethon.errors import FloodWaitError, MessageNotModifiedError, MessageIdInvalidError
+
+logger = logging.getLogger(__name__)
+
+class MessageSync:
+    def __init__(self, user_client, forwarder, db, flush_interval=5.0):
+        self.user_client = user_client
+        self.forwarder = forwarder
+        self.db = db
+        self.flush_interval = flush_interval
+        self.sync_jobs = {}  # Dictionary to keep track of running sync jobs
+
+    async def start_sync(self, user_id):
+        if user_id in self.sync_jobs:
+            logger.warning(f"Sync is already running for user {user_id}")
+            return
+
+        user_data = await self.db.get_user_credentials(user_id)
+        await self.forwarder.ensure_user_client_started(user_data)
+        source_channel = await self.forwarder.validate_channel(user_data['source'])
+        destination_channel = await self.forwarder.validate_channel(user_data['destination'])
+
+        job = {
+            'source': user_data['source'],
+            'destination': user_data['destination'],
+            'destination_channel': destination_channel,
+            'pending_edits': {},  # Source message ID -> latest edited message
+            'pending_deletes': set(),
+        }
+
+        async def on_edit(event):
+            job['pending_edits'][event.message.id] = event.message
+
+        async def on_delete(event):
+            for message_id in event.deleted_ids:
+                job['pending_edits'].pop(message_id, None)
+                job['pending_deletes'].add(message_id)
+
+        job['handlers'] = [
+            (on_edit, events.MessageEdited(chats=source_channel)),
+            (on_delete, events.MessageDeleted(chats=source_channel)),
+        ]
+        job['client'] = None
+        self._attach(user_id, job)
+
+        job['task'] = asyncio.create_task(self._flush_loop(user_id, job))
+        self.sync_jobs[user_id] = job
+        # Persisted so the job is restarted after the bot restarts (see main)
+        await self.db.save_user_credentials(user_id, {'syncing': True})
+        logger.info(f"Started edit/delete sync for user {user_id}")
+
+    async def resume_sync(self, user_id):
+        try:
+            await self.start_sync(user_id)
+        except Exception as e:
+            logger.error(f"Failed to resume sync for user {user_id}: {str(e)}", exc_info=True)
+
+    async def stop_sync(self, user_id):
+        await self.db.save_user_credentials(user_id, {'syncing': False})
+        job = self.sync_jobs.pop(user_id, None)
+        if not job:
+            logger.warning(f"No active sync job found for user {user_id}")
+            return
+
+        for callback, event in job['handlers']:
+            job['client'].remove_event_handler(callback, event)
+        job['task'].cancel()
+        try:
+            await job['task']
+        except asyncio.CancelledError:
+            pass
+        # Apply whatever was still queued when the job was stopped
+        try:
+            await self.flush(user_id, job)
+        except FloodWaitError as fwe:
+            logger.warning(f"Dropped {len(job['pending_edits'])} edits and {len(job['pending_deletes'])} deletions "
+                           f"for user {user_id} on stop: FloodWaitError of {fwe.seconds} seconds")
+        logger.info(f"Stopped edit/delete sync for user {user_id}")
+
+    def _attach(self, user_id, job):
+        # UserClient.start replaces the TelegramClient on reconnect, so follow it to the new one
+        client = self.user_client.client
+        if client is None or client is job['client']:
+            return
+        if job['client'] is not None:
+            logger.warning(f"User client was replaced, re-registering sync handlers for user {user_id}")
+            for callback, event in job['handlers']:
+                job['client'].remove_event_handler(callback, event)
+        for callback, event in job['handlers']:
+            client.add_event_handler(callback, event)
+        job['client'] = client
+
+    def _requeue(self, job, edits, deletes):
+        # Changes queued since the flush started are newer, so they win over the requeued ones
+        for source_id, message in edits.items():
+            if source_id not in deletes and source_id not in job['pending_deletes']:
+                job['pending_edits'].setdefault(source_id, message)
+        job['pending_deletes'].update(deletes)
+
+    async def _flush_loop(self, user_id, job):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self._attach(user_id, job)
+                await self.flush(user_id, job)
+            except FloodWaitError as fwe:
+                logger.warning(f"FloodWaitError in sync: Waiting for {fwe.seconds} seconds")
+                await asyncio.sleep(fwe.seconds)
+            except Exception as e:
+                logger.error(f"Error flushing sync for user {user_id}: {str(e)}", exc_info=True)
+
+    async def flush(self, user_id, job):
+        edits, job['pending_edits'] = job['pending_edits'], {}
+        deletes, job['pending_deletes'] = job['pending_deletes'], set()
+        if not edits and not deletes:
+            return
+
+        try:
+            id_map = await self.db.get_message_id_map(user_id, job['source'], job['destination'], list(edits) + list(deletes))
+        except Exception:
+            self._requeue(job, edits, deletes)
+            raise
+        client = self.user_client.client
+        destination_channel = job['destination_channel']
+
+        edits_applied = 0
+        remaining_edits = dict(edits)
+        for source_id, message in edits.items():
+            if source_id in id_map:
+                try:
+                    await client.edit_message(destination_channel, id_map[source_id], message.message, formatting_entities=message.entities)
+                    edits_applied += 1
+                except FloodWaitError:
+                    self._requeue(job, remaining_edits, deletes)
+                    raise
+                except (MessageNotModifiedError, MessageIdInvalidError):
+                    pass
+                except Exception as e:
+                    logger.error(f"Failed to sync edit of message {source_id} for user {user_id}: {str(e)}")
+            del remaining_edits[source_id]
+
+        delete_ids = [id_map[source_id] for source_id in deletes if source_id in id_map]
+        if delete_ids:
+            try:
+                await client.delete_messages(destination_channel, delete_ids)
+            except FloodWaitError:
+                self._requeue(job, {}, deletes)
+                raise
+            except Exception as e:
+                logger.error(f"Failed to sync {len(delete_ids)} deletions for user {user_id}: {str(e)}")
+                delete_ids = []
+
+        logger.info(f"Synced {edits_applied} edits and {len(delete_ids)} deletions for user {user_id}")
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import pytest
+from types import SimpleNamespace
+
+pytest.importorskip('telethon')
+import archive
+from archive import MessageArchive, resolve_archive_path
+from telethon.tl.types import DocumentAttributeAudio, DocumentAttributeFilename, DocumentAttributeVideo, MessageEntityBold, MessageEntityTextUrl, MessageMediaDocument
+
+def record(message_id, text="hello"):
+    return {'id': message_id, 'date': None, 'text': text, 'grouped_id': None, 'media': None, 'filename': None}
+
+def test_append_and_get_by_id(tmp_path):
+    store = MessageArchive(str(tmp_path))
+    for message_id in (5, 3, 900):
+        store.append(record(message_id, f"message {message_id}"))
+
+    assert store.get(3)['text'] == "message 3"
+    assert store.get(900)['text'] == "message 900"
+    assert store.get(4) is None
+    assert store.get(10 ** 6) is None
+    assert store.contains(5) and not store.contains(6)
+    store.close()
+
+def test_get_messages_mirrors_telethon_shape(tmp_path):
+    store = MessageArchive(str(tmp_path))
+    store.append(dict(record(7), media='7.jpg', filename='photo.jpg'))
+    messages = store.get_messages([6, 7])
+    assert messages[0] is None
+    assert messages[1].id == 7
+    assert messages[1].media is None
+    assert messages[1].media_path == os.path.join(str(tmp_path), 'media', '7.jpg')
+    store.close()
+
+def test_reopen_resumes_index_and_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'SEGMENT_MAX_BYTES', 100)
+    store = MessageArchive(str(tmp_path))
+    for message_id in range(1, 6):
+        store.append(record(message_id, "x" * 60))
+    segment_number = store.segment_number
+    store.close()
+    assert segment_number > 1
+
+    store = MessageArchive(str(tmp_path))
+    assert store.segment_number == segment_number
+    assert [store.get(message_id)['id'] for message_id in range(1, 6)] == [1, 2, 3, 4, 5]
+    store.append(record(6))
+    assert store.get(6)['text'] == "hello"
+    store.close()
+
+def test_reappending_overwrites_index_slot(tmp_path):
+    store = MessageArchive(str(tmp_path))
+    store.append(record(1, "old"))
+    store.append(record(1, "new"))
+    assert store.get(1)['text'] == "new"
+    store.close()
+
+def test_resolve_archive_path_confines_to_user_directory(tmp_path):
+    root = str(tmp_path)
+    assert resolve_archive_path(root, 42, 'backup') == os.path.join(os.path.realpath(root), '42', 'backup')
+    assert resolve_archive_path(root, 42, 'nested/backup').endswith(os.path.join('42', 'nested', 'backup'))
+
+@pytest.mark.parametrize('name', ['', '/etc', '..', '../43/backup', 'a/../../43', '.'])
+def test_resolve_archive_path_rejects_escapes(tmp_path, name):
+    with pytest.raises(ValueError):
+        resolve_archive_path(str(tmp_path), 42, name)
+
+def test_resolve_archive_path_rejects_symlink_escape(tmp_path):
+    user_root = tmp_path / 'root' / '42'
+    user_root.mkdir(parents=True)
+    (user_root / 'link').symlink_to(tmp_path)
+    with pytest.raises(ValueError):
+        resolve_archive_path(str(tmp_path / 'root'), 42, 'link')
+
+class FakeClient:
+    async def download_media(self, message, file):
+        path = file + '.mp4'
+        with open(path, 'wb') as f:
+            f.write(b'video')
+        return path
+
+def test_archive_message_with_video_document(tmp_path):
+    document = SimpleNamespace(attributes=[
+        DocumentAttributeVideo(duration=10, w=640, h=360),
+        DocumentAttributeFilename(file_name='clip.mp4'),
+    ])
+    message = SimpleNamespace(id=12, date=None, message="caption", entities=None, grouped_id=None,
+                              media=MessageMediaDocument(document=document))
+    store = MessageArchive(str(tmp_path))
+    asyncio.run(store.archive_message(FakeClient(), message))
+    stored = store.get(12)
+    assert stored['filename'] == 'clip.mp4'
+    assert stored['media'] == '12.mp4'
+    store.close()
+
+def test_archive_message_without_filename_or_document(tmp_path):
+    voice = SimpleNamespace(attributes=[DocumentAttributeAudio(duration=3, voice=True)])
+    store = MessageArchive(str(tmp_path))
+    for message_id, document in ((1, voice), (2, None)):
+        message = SimpleNamespace(id=message_id, date=None, message="", entities=None, grouped_id=None,
+                                  media=MessageMediaDocument(document=document))
+        asyncio.run(store.archive_message(FakeClient(), message))
+        assert store.get(message_id)['filename'] is None
+    store.close()
+
+def test_archive_message_keeps_entities(tmp_path):
+    entities = [MessageEntityBold(offset=0, length=4), MessageEntityTextUrl(offset=5, length=4, url='https://example.com')]
+    message = SimpleNamespace(id=3, date=None, message="bold link", entities=entities, grouped_id=None, media=None)
+    store = MessageArchive(str(tmp_path))
+    asyncio.run(store.archive_message(FakeClient(), message))
+    replayed, = store.get_messages([3])
+    assert replayed.text == "bold link"
+    assert replayed.entities == entities
+    store.append(record(4))
+    assert store.get_messages([4])[0].entities is None
+    store.close()
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+
+pytest.importorskip('motor')
+import database
+from database import Database, MESSAGE_MAP_BUCKET_SIZE
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        self.iterator = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeMessageMap:
+    """Just enough of a Motor collection for the bucketed message map."""
+
+    def __init__(self):
+        self.documents = {}
+        self.bulk_writes = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append(operations)
+        for query, update in operations:
+            key = (query['user_id'], query['source'], query['destination'], query['bucket'])
+            document = self.documents.setdefault(key, dict(query, ids={}))
+            for field, value in update['$set'].items():
+                document['ids'][field.split('.', 1)[1]] = value
+
+    def find(self, query, projection):
+        return FakeCursor([
+            document for document in self.documents.values()
+            if (document['user_id'], document['source'], document['destination']) == (query['user_id'], query['source'], query['destination'])
+            and document['bucket'] in query['bucket']['$in']
+        ])
+
+class FakeFlagCollection:
+    """Just enough of a Motor collection for the forwarded/replayed message flags."""
+
+    def __init__(self):
+        self.documents = []
+
+    def matches(self, document, query):
+        return all(document.get(field) == value for field, value in query.items())
+
+    async def update_one(self, query, update, upsert=False):
+        for document in self.documents:
+            if self.matches(document, query):
+                document.update(update['$set'])
+                return
+        self.documents.append(dict(query, **update['$set']))
+
+    async def find_one(self, query):
+        return next((document for document in self.documents if self.matches(document, query)), None)
+
+class FakeDb:
+    def __init__(self):
+        self.message_map = FakeMessageMap()
+        self.forwarded_messages = FakeFlagCollection()
+        self.replayed_messages = FakeFlagCollection()
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(database, 'UpdateOne', lambda query, update, upsert: (query, update))
+    db = Database()
+    db.db = FakeDb()
+    return db
+
+def test_message_id_map_round_trip_across_buckets(db):
+    id_map = {5: 105, MESSAGE_MAP_BUCKET_SIZE - 1: 200, MESSAGE_MAP_BUCKET_SIZE: 201, 3 * MESSAGE_MAP_BUCKET_SIZE + 7: 300}
+    asyncio.run(db.save_message_id_map(1, -100, -200, id_map))
+
+    # One upsert per bucket, all in a single bulk write
+    assert len(db.db.message_map.bulk_writes) == 1
+    assert len(db.db.message_map.bulk_writes[0]) == 3
+
+    found = asyncio.run(db.get_message_id_map(1, -100, -200, list(id_map) + [6, 10 * MESSAGE_MAP_BUCKET_SIZE]))
+    assert found == id_map
+
+def test_message_id_map_lookup_only_returns_requested_ids(db):
+    asyncio.run(db.save_message_id_map(1, -100, -200, {1: 11, 2: 12, 3: 13}))
+    assert asyncio.run(db.get_message_id_map(1, -100, -200, [2])) == {2: 12}
+
+def test_message_id_map_is_scoped_per_job(db):
+    asyncio.run(db.save_message_id_map(1, -100, -200, {1: 11}))
+    assert asyncio.run(db.get_message_id_map(2, -100, -200, [1])) == {}
+    assert asyncio.run(db.get_message_id_map(1, -100, -300, [1])) == {}
+
+def test_message_id_map_ignores_empty_input(db):
+    asyncio.run(db.save_message_id_map(1, -100, -200, {}))
+    assert db.db.message_map.bulk_writes == []
+    assert asyncio.run(db.get_message_id_map(1, -100, -200, [])) == {}
+
+def test_archive_replays_have_their_own_dedup_scope(db):
+    asyncio.run(db.mark_message_as_forwarded(1, 10))
+    assert asyncio.run(db.is_message_forwarded(1, 10))
+    assert not asyncio.run(db.is_message_forwarded(1, 10, 'backup'))
+
+    asyncio.run(db.mark_message_as_forwarded(1, 11, 'backup'))
+    assert asyncio.run(db.is_message_forwarded(1, 11, 'backup'))
+    assert not asyncio.run(db.is_message_forwarded(1, 11, 'other'))
+    assert not asyncio.run(db.is_message_forwarded(1, 11))
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+pytest.importorskip('telethon')
+from telethon import types
+from telethon.tl.functions.messages import SendMessageRequest
+from forwarder import Forwarder
+from message_descriptor import MessageDescriptor
+
+def make_config(idempotent=True):
+    return SimpleNamespace(MAX_FORWARD_BATCH=100, FORWARD_DELAY_MIN=60, FORWARD_DELAY_MAX=120,
+                           IDEMPOTENT_FORWARDING=idempotent, ARCHIVE_ROOT='archives')
+
+class FakeTelegramClient:
+    def __init__(self):
+        self.requests = []
+
+    async def get_input_entity(self, entity):
+        return types.InputPeerChannel(channel_id=entity, access_hash=0)
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        sent = SimpleNamespace(id=len(self.requests))
+        return SimpleNamespace(updates=[types.UpdateNewChannelMessage(message=sent, pts=0, pts_count=0)])
+
+def test_random_id_is_deterministic_per_job_message_and_destination():
+    forwarder = Forwarder(SimpleNamespace(client=None), None, make_config())
+    key = (1, 100, 5, 200)
+    random_id = forwarder.generate_random_id(*key)
+    assert random_id == forwarder.generate_random_id(*key)
+    assert -2 ** 63 <= random_id < 2 ** 63
+    for position in range(len(key)):
+        changed = list(key)
+        changed[position] += 1
+        assert forwarder.generate_random_id(*changed) != random_id
+
+def test_random_id_is_random_outside_idempotent_mode():
+    forwarder = Forwarder(SimpleNamespace(client=None), None, make_config(idempotent=False))
+    assert forwarder.generate_random_id(1, 100, 5, 200) != forwarder.generate_random_id(1, 100, 5, 200)
+
+def test_text_messages_are_sent_with_the_deterministic_random_id():
+    client = FakeTelegramClient()
+    forwarder = Forwarder(SimpleNamespace(client=client, account_id=None), None, make_config())
+    entities = [types.MessageEntityBold(offset=0, length=5)]
+    message = MessageDescriptor(id=5, peer_id=types.PeerChannel(channel_id=100), text="hello", entities=entities)
+
+    sent = asyncio.run(forwarder.forward_message(message, 200, user_id=1))
+
+    request, = client.requests
+    assert isinstance(request, SendMessageRequest)
+    assert request.message == "hello"
+    assert request.entities == entities
+    assert request.random_id == forwarder.generate_random_id(1, 100, 5, 200)
+    assert sent.id == 1
+
+class FakeDb:
+    def __init__(self, forwarded_ids, id_map):
+        self.forwarded_ids = forwarded_ids
+        self.id_map = id_map
+
+    async def get_forwarded_message_ids(self, user_id, message_ids):
+        return self.forwarded_ids & set(message_ids)
+
+    async def get_message_id_map(self, user_id, source, destination, source_ids):
+        return {source_id: self.id_map[source_id] for source_id in source_ids if source_id in self.id_map}
+
+def test_report_unmapped_counts_forwarded_messages_without_a_mapping():
+    db = FakeDb({1, 2, 3, 50}, {1: 11})
+    forwarder = Forwarder(SimpleNamespace(client=None), db, make_config())
+    user_data = {'source': -100, 'destination': -200}
+    assert asyncio.run(forwarder.report_unmapped(1, user_data, list(range(1, 11)), {})) == 2
+    assert asyncio.run(forwarder.report_unmapped(1, user_data, [20, 21], {})) == 0
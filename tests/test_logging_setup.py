@@ -0,0 +1,83 @@
+import logging
+import sys
+import logging_setup
+from logging_setup import DeferredQueueHandler, SamplingFilter
+
+def make_record(message="forwarded %d", args=(1,), **extra):
+    record = logging.LogRecord('forwarder', logging.INFO, __file__, 1, message, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_sampling_limits_each_event_and_job(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logging_setup.time, 'monotonic', clock)
+    sampler = SamplingFilter(max_records=2, period=60)
+
+    passed = [sampler.filter(make_record(event='message_forwarded', job=1)) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    # Another job and records without an event are not affected
+    assert sampler.filter(make_record(event='message_forwarded', job=2))
+    assert all(sampler.filter(make_record(job=1)) for _ in range(5))
+
+def test_next_window_reports_suppressed_count(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logging_setup.time, 'monotonic', clock)
+    sampler = SamplingFilter(max_records=1, period=60)
+    for _ in range(4):
+        sampler.filter(make_record(event='message_forwarded', job=1))
+
+    clock.now += 60
+    record = make_record(event='message_forwarded', job=1)
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+
+def test_expired_windows_are_pruned(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logging_setup.time, 'monotonic', clock)
+    sampler = SamplingFilter(max_records=1, period=60)
+    for job in range(100):
+        sampler.filter(make_record(event='message_forwarded', job=job))
+    sampler.filter(make_record(event='message_forwarded', job=0))  # Suppressed, so its window survives one more period
+
+    clock.now += 61
+    sampler.filter(make_record(event='other', job=None))
+    assert set(sampler.windows) == {('message_forwarded', 0), ('other', None)}
+
+    clock.now += 60
+    sampler.filter(make_record(event='other', job=None))
+    assert set(sampler.windows) == {('other', None)}
+
+def test_prepare_defers_primitive_args():
+    handler = DeferredQueueHandler(None)
+    record = make_record("message %d as %s", (1, 'x'))
+    prepared = handler.prepare(record)
+    assert prepared is not record
+    assert prepared.args == (1, 'x')
+    assert prepared.getMessage() == "message 1 as x"
+
+def test_prepare_snapshots_mutable_args():
+    handler = DeferredQueueHandler(None)
+    payload = {'state': 'before'}
+    prepared = handler.prepare(make_record("payload %s", (payload,)))
+    payload['state'] = 'after'
+    assert prepared.args is None
+    assert prepared.getMessage() == "payload {'state': 'before'}"
+
+def test_prepare_renders_exceptions_eagerly():
+    handler = DeferredQueueHandler(None)
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        record = logging.LogRecord('forwarder', logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+    prepared = handler.prepare(record)
+    assert prepared.exc_info is None
+    assert 'RuntimeError: boom' in prepared.exc_text
+    assert 'RuntimeError: boom' in logging_setup.JsonFormatter().format(prepared)
@@ -0,0 +1,53 @@
+import pytest
+from types import SimpleNamespace
+
+pytest.importorskip('telethon')
+from telethon.tl.types import (DocumentAttributeFilename, DocumentAttributeVideo, MessageEntityBold, MessageMediaDocument,
+                               MessageMediaPhoto, MessageMediaWebPage, PeerChannel, WebPageEmpty)
+from message_descriptor import MessageDescriptor
+
+def make_message(media=None, message="caption", entities=None):
+    return SimpleNamespace(id=7, peer_id=PeerChannel(channel_id=100), sender_id=42, grouped_id=None,
+                           media=media, message=message, entities=entities)
+
+def make_document(*attributes):
+    return SimpleNamespace(id=555, size=1024, attributes=list(attributes))
+
+def test_document_with_filename():
+    media = MessageMediaDocument(document=make_document(DocumentAttributeVideo(duration=1, w=1, h=1), DocumentAttributeFilename(file_name='a.mp4')))
+    descriptor = MessageDescriptor.from_message(make_message(media))
+    assert descriptor.media_kind == 'document'
+    assert (descriptor.document_id, descriptor.size, descriptor.filename) == (555, 1024, 'a.mp4')
+    assert descriptor.forwardable_media
+    # The caption travels with the forwarded media, so it isn't kept
+    assert descriptor.text is None and descriptor.entities is None
+    assert descriptor.text_length == len("caption")
+
+def test_document_without_filename():
+    descriptor = MessageDescriptor.from_message(make_message(MessageMediaDocument(document=make_document(DocumentAttributeVideo(duration=1, w=1, h=1)))))
+    assert descriptor.media_kind == 'document'
+    assert descriptor.filename is None
+
+def test_document_that_is_unavailable_is_still_forwarded():
+    descriptor = MessageDescriptor.from_message(make_message(MessageMediaDocument(document=None), message=""))
+    assert descriptor.media_kind == 'other'
+    assert descriptor.forwardable_media
+
+def test_photo():
+    descriptor = MessageDescriptor.from_message(make_message(MessageMediaPhoto()))
+    assert descriptor.media_kind == 'photo'
+    assert descriptor.forwardable_media and descriptor.text is None
+
+def test_webpage_is_sent_as_text():
+    entities = [MessageEntityBold(offset=0, length=4)]
+    descriptor = MessageDescriptor.from_message(make_message(MessageMediaWebPage(webpage=WebPageEmpty(id=1)), "link https://example.com", entities))
+    assert descriptor.media_kind == 'webpage'
+    assert not descriptor.forwardable_media
+    assert descriptor.text == "link https://example.com"
+    assert descriptor.entities == entities
+
+def test_text():
+    descriptor = MessageDescriptor.from_message(make_message(None, "hello"))
+    assert descriptor.media_kind is None
+    assert not descriptor.forwardable_media
+    assert (descriptor.id, descriptor.sender_id, descriptor.text, descriptor.text_length) == (7, 42, "hello", 5)
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip('telethon')
+from planner import dump_metadata, estimate, load_metadata, simulate
+
+def make_record(message_id, media_kind=None, filename=None, forwarded=False, filename_forwarded=False, grouped_id=None):
+    return {
+        'id': message_id, 'sender_id': 7, 'grouped_id': grouped_id, 'media_kind': media_kind, 'size': None,
+        'filename': filename, 'text_length': 5, 'forwarded': forwarded, 'filename_forwarded': filename_forwarded,
+    }
+
+def make_metadata(records, start_id=1, end_id=None):
+    end_id = end_id if end_id is not None else max(record['id'] for record in records)
+    return {'start_id': start_id, 'end_id': end_id, 'missing': end_id - start_id + 1 - len(records), 'rate_limit_period': 60, 'records': records}
+
+def test_counts_forwarded_and_filtered_messages():
+    metadata = make_metadata([
+        make_record(1),
+        make_record(2, forwarded=True),
+        make_record(3, 'document', 'a.mkv'),
+        make_record(4, 'document', 'a.mkv'),  # Same file again: filtered after message 3
+        make_record(5, 'document', 'b.mkv', filename_forwarded=True),
+        make_record(6, 'webpage'),
+    ], end_id=8)
+    result = simulate(metadata, batch_size=100, delay_min=60, delay_max=120, rate_limit_period=60, pause=0, rpc_latency=0)
+    assert result['forwarded'] == 3
+    assert result['filtered'] == 2
+    assert result['batches'] == 1
+    assert result['user_rpcs'] == 1 + 3  # One get_messages plus one send per forwarded message
+
+def test_rate_limiter_and_batch_delays_dominate_large_ranges():
+    metadata = make_metadata([make_record(message_id) for message_id in range(1, 31)])
+    result = simulate(metadata, batch_size=10, delay_min=5, delay_max=5, rate_limit_period=60, pause=0, rpc_latency=0)
+    assert result['forwarded'] == 30
+    assert result['long_pauses'] == 3
+    # Ten calls per window: messages 11-20 wait one window and 21-30 wait a second one
+    assert result['seconds'] == pytest.approx(2 * 60 + 5)
+    shorter_window = simulate(metadata, batch_size=10, delay_min=5, delay_max=5, rate_limit_period=30, pause=0, rpc_latency=0)
+    assert shorter_window['seconds'] == pytest.approx(2 * 30 + 5)
+
+def test_estimates_are_ordered():
+    metadata = make_metadata([make_record(message_id) for message_id in range(1, 251)])
+    estimates = estimate(metadata, batch_size=100, delay_min=60, delay_max=120, rate_limit_period=60)
+    assert estimates['best']['seconds'] <= estimates['expected']['seconds'] <= estimates['worst']['seconds']
+
+def test_nothing_to_forward_costs_only_fetches():
+    metadata = make_metadata([make_record(message_id, forwarded=True) for message_id in range(1, 201)])
+    result = simulate(metadata, batch_size=100, delay_min=60, delay_max=120, rate_limit_period=60, rpc_latency=1)
+    assert result['forwarded'] == 0
+    assert result['user_rpcs'] == 2
+    assert result['seconds'] == pytest.approx(2 + 1)  # Two fetches and the first progress edit
+
+def test_metadata_round_trip():
+    metadata = make_metadata([make_record(1), make_record(3, 'photo', grouped_id=9)], end_id=4)
+    loaded = load_metadata(dump_metadata(metadata).decode('utf-8').splitlines())
+    assert loaded == metadata
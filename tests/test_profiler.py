@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+from collections import Counter
+
+from profiler import LoopProfiler, ProfilerBusyError
+
+def test_folded_output_is_sorted_by_count():
+    stacks = Counter({'main (a.py:1);run (b.py:2)': 3, 'main (a.py:1)': 5})
+    assert LoopProfiler()._folded(stacks) == "main (a.py:1) 5\nmain (a.py:1);run (b.py:2) 3\n"
+
+def test_report_splits_wall_time_by_coroutine():
+    profiler = LoopProfiler(interval=0.01, slow_callback_duration=0.2)
+    stacks = Counter({'outer (a.py:1);middle (a.py:5);inner (a.py:9);leaf (a.py:12)': 4})
+    coroutines = Counter({'Forwarder.forward_messages': 3, '<idle>': 1})
+    report = profiler._report(2.0, stacks, coroutines, ["Executing <Handle> took 0.300 seconds"])
+    lines = report.splitlines()
+
+    assert lines[0] == "Event loop profile: 2.0s, 4 samples every 10ms"
+    assert "      1.50s   75.0%  Forwarder.forward_messages" in lines
+    assert "      0.50s   25.0%  <idle>" in lines
+    assert "Slow callbacks (> 200ms): 1" in lines
+    assert "  Executing <Handle> took 0.300 seconds" in lines
+    # Top stacks show the innermost three frames, innermost first
+    assert "       4  leaf (a.py:12) <- inner (a.py:9) <- middle (a.py:5)" in lines
+
+def test_report_without_samples():
+    report = LoopProfiler()._report(1.0, Counter(), Counter(), [])
+    assert "Slow callbacks (> 100ms): 0" in report
+
+def test_concurrent_profiles_are_rejected():
+    profiler = LoopProfiler(interval=0.001)
+
+    async def run_two():
+        first = asyncio.create_task(profiler.profile(0.05))
+        await asyncio.sleep(0)
+        with pytest.raises(ProfilerBusyError):
+            await profiler.profile(0.05)
+        folded, report = await first
+        return report
+
+    assert asyncio.run(run_two()).startswith("Event loop profile:")
+    assert not profiler.running
@@ -8,12 +8,14 @@ logger = logging.getLogger(__name__)
 class UserClient:
     def __init__(self):
         self.client = None
+        self.account_id = None
 
     async def start(self, api_id, api_hash, session_string=None):
         try:
             session = StringSession(session_string) if session_string else StringSession()
             self.client = TelegramClient(session, api_id, api_hash)
             await self.client.start()
+            self.account_id = (await self.client.get_me(input_peer=True)).user_id
             logger.info("User client started successfully")
         except Exception as e:
             logger.error(f"Failed to start user client: {str(e)}")